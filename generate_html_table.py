@@ -5,33 +5,27 @@ Rows: genes, Columns: sample directories, Values: ranked alleles with abundance
 """
 
 import os
-import re
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from hisat_common import iter_ranked, PAGE_FOOT
 
 def parse_report_file(report_path):
     """Parse a single report file and extract ranked results by gene."""
-    results = {}
-
-    with open(report_path, 'r') as f:
-        content = f.read()
+    results = defaultdict(list)
 
-    # Find all ranked sections using regex
-    # Pattern: "1 ranked GENE*ALLELE (abundance: XX.XX%)"
-    pattern = r'(\d+) ranked ([A-Z0-9]+)\*([^\s]+) \(abundance: ([\d.]+)%\)'
-    matches = re.findall(pattern, content)
+    content = Path(report_path).read_text()
 
-    current_gene = None
-    for rank, gene, allele, abundance in matches:
-        if gene not in results:
-            results[gene] = []
+    # Scan ranked sections lazily
+    for rank, gene, allele, abundance in iter_ranked(content):
         results[gene].append({
-            'rank': int(rank),
+            'rank': rank,
             'allele': allele,
-            'abundance': float(abundance)
+            'abundance': abundance
         })
 
-    return results
+    return dict(results)
 
 def collect_all_results(output_dir):
     """Collect results from all directories in the output folder."""
@@ -44,6 +38,8 @@ def collect_all_results(output_dir):
         print(f"Error: Directory {output_dir} does not exist")
         return None, None, None
 
+    sample_names = []
+    report_paths = []
     for sample_dir in sorted(output_path.iterdir()):
         if not sample_dir.is_dir():
             continue
@@ -56,24 +52,25 @@ def collect_all_results(output_dir):
             print(f"Warning: No report file found in {sample_name}")
             continue
 
-        report_file = report_files[0]
-        results = parse_report_file(report_file)
+        sample_names.append(sample_name)
+        report_paths.append(report_files[0])
 
+    # Parse the reports concurrently; each one is independent file I/O
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+        parsed = list(executor.map(parse_report_file, report_paths))
+
+    for sample_name, results in zip(sample_names, parsed):
         if results:
             samples.append(sample_name)
             all_data[sample_name] = results
 
     # Get all unique genes across all samples
-    all_genes = set()
-    for sample_results in all_data.values():
-        all_genes.update(sample_results.keys())
+    all_genes = set().union(*all_data.values())
 
     return all_data, sorted(samples), sorted(all_genes)
 
-def generate_html_table(all_data, samples, genes, output_file):
-    """Generate HTML table with genes as rows and samples as columns."""
-
-    html = """<!DOCTYPE html>
+# Page skeleton around the results table
+_TABLE_HEAD = """<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -143,49 +140,49 @@ def generate_html_table(all_data, samples, genes, output_file):
                     <th class="gene-col">Gene</th>
 """
 
-    # Add sample column headers
-    for sample in samples:
-        html += f"                    <th>{sample}</th>\n"
-
-    html += """                </tr>
+_TABLE_BODY_START = """                </tr>
             </thead>
             <tbody>
 """
 
-    # Add rows for each gene
-    for gene in genes:
-        html += f"                <tr>\n                    <td><strong>{gene}</strong></td>\n"
+def generate_html_table(all_data, samples, genes, output_file):
+    """Generate HTML table with genes as rows and samples as columns."""
 
-        for sample in samples:
-            html += "                    <td>"
+    # Stream the page straight to disk instead of assembling it in memory
+    with open(output_file, 'w', buffering=1 << 20) as f:
+        f.write(_TABLE_HEAD)
 
-            if sample in all_data and gene in all_data[sample]:
-                ranked_alleles = all_data[sample][gene]
-                # Sort by rank
-                ranked_alleles.sort(key=lambda x: x['rank'])
+        # Add sample column headers
+        f.write(''.join(f"                    <th>{sample}</th>\n" for sample in samples))
 
-                # Display each ranked allele
-                for allele_info in ranked_alleles:
-                    rank = allele_info['rank']
-                    allele = allele_info['allele']
-                    abundance = allele_info['abundance']
-                    html += f'<span class="allele rank-{rank}">{rank}. {allele} ({abundance}%)</span>'
-            else:
-                html += "-"
+        f.write(_TABLE_BODY_START)
 
-            html += "</td>\n"
+        # Add rows for each gene
+        for gene in genes:
+            f.write(f"                <tr>\n                    <td><strong>{gene}</strong></td>\n")
 
-        html += "                </tr>\n"
+            for sample in samples:
+                f.write("                    <td>")
 
-    html += """            </tbody>
-        </table>
-    </div>
-</body>
-</html>
-"""
+                if sample in all_data and gene in all_data[sample]:
+                    ranked_alleles = all_data[sample][gene]
+                    # Sort by rank
+                    ranked_alleles.sort(key=lambda x: x['rank'])
+
+                    # Display each ranked allele
+                    for allele_info in ranked_alleles:
+                        rank = allele_info['rank']
+                        allele = allele_info['allele']
+                        abundance = allele_info['abundance']
+                        f.write(f'<span class="allele rank-{rank}">{rank}. {allele} ({abundance}%)</span>')
+                else:
+                    f.write("-")
+
+                f.write("</td>\n")
+
+            f.write("                </tr>\n")
 
-    with open(output_file, 'w') as f:
-        f.write(html)
+        f.write(PAGE_FOOT)
 
     print(f"HTML table generated: {output_file}")
 
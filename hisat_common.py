@@ -0,0 +1,38 @@
+"""
+Helpers shared by generate_html_table.py and merge_results.py.
+Parses HISAT-genotype ranked-allele reports and holds common HTML fragments.
+"""
+
+import re
+import sys
+
+# Pattern: "1 ranked GENE*ALLELE (abundance: XX.XX%)"
+_RANKED_RE = re.compile(r'(\d+) ranked ([A-Z0-9]+)\*([^\s]+) \(abundance: ([\d.]+)%\)')
+
+# Closes the results table and the page opened by either report generator
+PAGE_FOOT = """            </tbody>
+        </table>
+    </div>
+</body>
+</html>
+"""
+
+def iter_ranked(content, max_rank=None):
+    """Yield (rank, gene, allele, abundance) for each ranked allele in a report.
+
+    When max_rank is given, matches whose rank number exceeds max_rank are
+    skipped, so max_rank=2 keeps ranks 1 and 2.
+    """
+    # A match never spans lines and always contains the literal " ranked ",
+    # so only run the regex on lines that can hold one
+    for line in content.splitlines():
+        if ' ranked ' not in line:
+            continue
+
+        for m in _RANKED_RE.finditer(line):
+            rank = int(m.group(1))
+            if max_rank is not None and rank > max_rank:
+                continue
+
+            # Gene symbols repeat across every report; share one string per symbol
+            yield rank, sys.intern(m.group(2)), m.group(3), float(m.group(4))
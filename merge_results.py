@@ -6,85 +6,235 @@ Rows: genes, Columns: methods (estimation vs hisat-genotype)
 """
 
 import os
-import re
+import sys
 import csv
+import functools
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from hisat_common import iter_ranked, PAGE_FOOT
+
+# Shared stylesheet written once next to the per-sample pages
+STYLESHEET_NAME = 'style.css'
+_STYLESHEET = """body {
+    font-family: Arial, sans-serif;
+    margin: 20px;
+    background-color: #f5f5f5;
+}
+h1 {
+    color: #333;
+    text-align: center;
+}
+.sample-info {
+    text-align: center;
+    margin-bottom: 20px;
+    font-size: 18px;
+    color: #666;
+}
+.table-container {
+    overflow-x: auto;
+    background-color: white;
+    padding: 20px;
+    border-radius: 8px;
+    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+    max-width: 1200px;
+    margin: 0 auto;
+}
+table {
+    border-collapse: collapse;
+    width: 100%;
+}
+th, td {
+    border: 1px solid #ddd;
+    padding: 12px;
+    text-align: left;
+}
+th {
+    background-color: #4CAF50;
+    color: white;
+    font-weight: bold;
+}
+th.gene-col {
+    background-color: #2196F3;
+    width: 100px;
+}
+th.method-col {
+    background-color: #FF9800;
+    width: 350px;
+}
+.optitype-allele {
+    background-color: #f3e5f5;
+}
+.hlala-allele {
+    background-color: #e8f5e9;
+}
+tr:nth-child(even) {
+    background-color: #f9f9f9;
+}
+tr:hover {
+    background-color: #f1f1f1;
+}
+.allele {
+    display: block;
+    margin: 3px 0;
+    padding: 2px 5px;
+    background-color: #e3f2fd;
+    border-radius: 3px;
+    font-family: monospace;
+}
+.estimation-allele {
+    background-color: #fff3e0;
+}
+.rank-info {
+    color: #666;
+    font-size: 11px;
+}
+.no-data {
+    color: #999;
+    font-style: italic;
+}
+.matching {
+    background-color: #c8e6c9;
+    font-weight: bold;
+}
+"""
 
-def parse_hisat_report(report_path):
-    """Parse HISAT-genotype report and extract top ranked alleles per gene."""
-    results = {}
+# Page skeleton around the comparison table; takes the sample name,
+# stylesheet name and sample name again
+_PAGE_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>HLA Typing Results - %s</title>
+    <link rel="stylesheet" href="%s">
+</head>
+<body>
+    <h1>HLA Typing Results Comparison</h1>
+    <div class="sample-info">Sample: <strong>%s</strong></div>
+    <div class="table-container">
+        <table>
+            <thead>
+                <tr>
+                    <th class="gene-col">Gene</th>
+                    <th class="method-col">OptiType</th>
+                    <th class="method-col">HLA-LA</th>
+                    <th class="method-col">HLA-HD</th>
+                    <th class="method-col">HISAT-genotype</th>
+                </tr>
+            </thead>
+            <tbody>
+"""
 
-    with open(report_path, 'r') as f:
-        content = f.read()
+# One gene row of the per-sample comparison table
+_ROW_TMPL = ("                <tr>\n"
+             "                    <td><strong>%s</strong></td>\n"
+             "                    <td>%s</td>\n"
+             "                    <td>%s</td>\n"
+             "                    <td>%s</td>\n"
+             "                    <td>%s</td>\n"
+             "                </tr>\n")
+_NO_DATA = '<span class="no-data">No data</span>'
 
-    # Find all ranked sections - get top 2 ranked alleles
-    pattern = r'(\d+) ranked ([A-Z0-9]+)\*([^\s]+) \(abundance: ([\d.]+)%\)'
-    matches = re.findall(pattern, content)
+def parse_hisat_report(report_path):
+    """Parse HISAT-genotype report and extract top ranked alleles per gene."""
+    results = defaultdict(list)
 
-    for rank, gene, allele, abundance in matches:
-        if gene not in results:
-            results[gene] = []
+    content = Path(report_path).read_text()
 
-        # Only keep top 2 ranked
-        if int(rank) <= 2:
-            results[gene].append({
-                'rank': int(rank),
-                'allele': f"HLA-{gene}*{allele}",
-                'abundance': float(abundance)
-            })
+    # Scan ranked sections lazily - only keep top 2 ranked alleles
+    for rank, gene, allele, abundance in iter_ranked(content, max_rank=2):
+        results[gene].append({
+            'rank': rank,
+            'allele': f"HLA-{gene}*{allele}",
+            'abundance': abundance
+        })
 
-    return results
+    return dict(results)
 
 def parse_estimation_result(result_path):
     """Parse estimation final result file."""
     results = {}
 
-    with open(result_path, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
+    for line in Path(result_path).read_text().splitlines():
+        line = line.strip()
+        if not line:
+            continue
 
-            parts = line.split('\t')
-            if len(parts) >= 3:
-                gene = parts[0].strip()
-                allele1 = parts[1].strip()
-                allele2 = parts[2].strip()
+        parts = line.split('\t')
+        if len(parts) >= 3:
+            gene = sys.intern(parts[0].strip())
+            allele1 = parts[1].strip()
+            allele2 = parts[2].strip()
 
-                results[gene] = []
-                if allele1 and allele1 != '-' and allele1 != 'Not typed':
-                    results[gene].append(allele1)
-                if allele2 and allele2 != '-' and allele2 != 'Not typed':
-                    results[gene].append(allele2)
+            results[gene] = []
+            if allele1 and allele1 != '-' and allele1 != 'Not typed':
+                results[gene].append(allele1)
+            if allele2 and allele2 != '-' and allele2 != 'Not typed':
+                results[gene].append(allele2)
 
     return results
 
-def parse_optitype_result(optitype_dir, sample_name):
+def find_first_file(root, suffix):
+    """Walk root depth-first and return the path of the first file ending in suffix."""
+    stack = [root]
+    while stack:
+        subdirs = []
+        try:
+            it = os.scandir(stack.pop())
+        except PermissionError:
+            # Skip unreadable directories, like Path.rglob
+            continue
+        with it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(suffix):
+                    return entry.path
+        # Visit subdirectories in listing order, like Path.rglob
+        stack.extend(reversed(subdirs))
+    return None
+
+@functools.lru_cache(maxsize=None)
+def find_optitype_result(optitype_root, sample_name):
+    """Locate the OptiType result TSV for a sample, or None if there is none."""
+    sample_path = optitype_root / sample_name
+    if not sample_path.exists():
+        return None
+
+    # Find the most recent result file
+    return find_first_file(str(sample_path), '_result.tsv')
+
+def parse_optitype_result(optitype_root, sample_name):
     """Parse OptiType TSV result file."""
     results = {}
 
     # Find the result TSV file
-    sample_path = Path(optitype_dir) / sample_name
-    if not sample_path.exists():
-        return results
-
-    # Find the most recent result file
-    tsv_files = list(sample_path.rglob('*_result.tsv'))
-    if not tsv_files:
+    tsv_file = find_optitype_result(optitype_root, sample_name)
+    if tsv_file is None:
         return results
 
     # Read the TSV file
-    with open(tsv_files[0], 'r') as f:
-        reader = csv.DictReader(f, delimiter='\t')
+    with open(tsv_file, 'r') as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = next(reader, None)
+        if header is None:
+            return results
+
+        # OptiType provides A1, A2, B1, B2, C1, C2; resolve their columns once
+        columns = [(gene, [header.index(f'{gene}{i}') for i in ['1', '2'] if f'{gene}{i}' in header])
+                   for gene in ['A', 'B', 'C']]
+
         for row in reader:
-            # OptiType provides A1, A2, B1, B2, C1, C2
-            for gene in ['A', 'B', 'C']:
+            for gene, indices in columns:
                 alleles = []
-                for i in ['1', '2']:
-                    col = f'{gene}{i}'
-                    if col in row and row[col]:
-                        allele = row[col].strip()
+                for j in indices:
+                    if j < len(row) and row[j]:
+                        allele = row[j].strip()
                         if allele:
                             # Format as HLA-A*02:01
                             alleles.append(f'HLA-{allele}')
@@ -94,18 +244,17 @@ def parse_optitype_result(optitype_dir, sample_name):
 
     return results
 
-def parse_hlala_result(hlala_dir, sample_name):
+def parse_hlala_result(hlala_root, sample_name):
     """Parse HLA-LA bestguess file."""
-    results = {}
+    results = defaultdict(list)
 
     # Find the bestguess file
-    bestguess_file = Path(hlala_dir) / sample_name / 'hla' / 'R1_bestguess_G.txt'
+    bestguess_file = hlala_root / sample_name / 'hla' / 'R1_bestguess_G.txt'
     if not bestguess_file.exists():
-        return results
+        return {}
 
     # Read the file
-    with open(bestguess_file, 'r') as f:
-        lines = f.readlines()
+    lines = bestguess_file.read_text().splitlines()
 
     # Skip header line
     for line in lines[1:]:
@@ -115,24 +264,21 @@ def parse_hlala_result(hlala_dir, sample_name):
 
         parts = line.split('\t')
         if len(parts) >= 3:
-            gene = parts[0].strip()
+            gene = sys.intern(parts[0].strip())
             allele = parts[2].strip()
 
             # Remove G suffix and N suffix for cleaner display
             allele = allele.replace('G', '').strip()
 
-            if gene not in results:
-                results[gene] = []
-
             # Format as HLA-A*02:01:01
             if not allele.startswith('HLA-'):
                 allele = f'HLA-{allele}'
 
             results[gene].append(allele)
 
-    return results
+    return dict(results)
 
-def collect_sample_data(sample_name, hisat_dir, estimation_dir, optitype_dir, hlala_dir):
+def collect_sample_data(sample_name, hisat_root, estimation_root, optitype_root, hlala_root):
     """Collect HISAT, estimation, OptiType, and HLA-LA data for a sample."""
     data = {
         'sample': sample_name,
@@ -143,198 +289,86 @@ def collect_sample_data(sample_name, hisat_dir, estimation_dir, optitype_dir, hl
     }
 
     # Get HISAT data
-    hisat_path = Path(hisat_dir) / sample_name
+    hisat_path = hisat_root / sample_name
     if hisat_path.exists():
         report_files = list(hisat_path.glob('*.report'))
         if report_files:
             data['hisat'] = parse_hisat_report(report_files[0])
 
     # Get estimation data
-    estimation_path = Path(estimation_dir) / sample_name / 'result' / f'{sample_name}_final.result.txt'
+    estimation_path = estimation_root / sample_name / 'result' / f'{sample_name}_final.result.txt'
     if estimation_path.exists():
         data['estimation'] = parse_estimation_result(estimation_path)
 
     # Get OptiType data
-    data['optitype'] = parse_optitype_result(optitype_dir, sample_name)
+    data['optitype'] = parse_optitype_result(optitype_root, sample_name)
 
     # Get HLA-LA data
-    data['hlala'] = parse_hlala_result(hlala_dir, sample_name)
+    data['hlala'] = parse_hlala_result(hlala_root, sample_name)
+
+    # Sort alleles once here so the HTML generator can iterate them directly
+    for method in ('optitype', 'hlala', 'estimation'):
+        for alleles in data[method].values():
+            alleles.sort()
+    for allele_infos in data['hisat'].values():
+        allele_infos.sort(key=lambda x: x['allele'])
 
     return data
 
+@functools.lru_cache(maxsize=4096)
+def allele_span(css_class, allele):
+    """Render one allele span; alleles recur across samples, so cache them."""
+    return f'<span class="allele {css_class}">{allele}</span>'
+
+@functools.lru_cache(maxsize=4096)
+def hisat_allele_span(allele, rank, abundance):
+    """Render one HISAT-genotype allele span with its rank and abundance."""
+    return (f'<span class="allele" data-rank="{rank}">{allele} '
+            f'<span class="rank-info">(rank: {rank}, {abundance}%)</span></span>')
+
+def format_alleles(alleles, css_class):
+    """Format a sorted, non-empty list of allele names as spans for one table cell."""
+    return ''.join([allele_span(css_class, allele) for allele in alleles])
+
+def format_hisat_alleles(allele_infos):
+    """Format sorted, non-empty HISAT-genotype allele records as spans carrying rank and abundance."""
+    return ''.join([hisat_allele_span(info['allele'], info['rank'], info['abundance'])
+                    for info in allele_infos])
+
 def generate_sample_html(data, output_file):
     """Generate HTML table for a single sample comparing methods."""
     sample_name = data['sample']
 
     # Get all genes from all sources
-    all_genes = set()
-    all_genes.update(data['hisat'].keys())
-    all_genes.update(data['estimation'].keys())
-    all_genes.update(data['optitype'].keys())
-    all_genes.update(data['hlala'].keys())
-    all_genes = sorted(all_genes)
-
-    html = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>HLA Typing Results - {sample_name}</title>
-    <style>
-        body {{
-            font-family: Arial, sans-serif;
-            margin: 20px;
-            background-color: #f5f5f5;
-        }}
-        h1 {{
-            color: #333;
-            text-align: center;
-        }}
-        .sample-info {{
-            text-align: center;
-            margin-bottom: 20px;
-            font-size: 18px;
-            color: #666;
-        }}
-        .table-container {{
-            overflow-x: auto;
-            background-color: white;
-            padding: 20px;
-            border-radius: 8px;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            max-width: 1200px;
-            margin: 0 auto;
-        }}
-        table {{
-            border-collapse: collapse;
-            width: 100%;
-        }}
-        th, td {{
-            border: 1px solid #ddd;
-            padding: 12px;
-            text-align: left;
-        }}
-        th {{
-            background-color: #4CAF50;
-            color: white;
-            font-weight: bold;
-        }}
-        th.gene-col {{
-            background-color: #2196F3;
-            width: 100px;
-        }}
-        th.method-col {{
-            background-color: #FF9800;
-            width: 350px;
-        }}
-        .optitype-allele {{
-            background-color: #f3e5f5;
-        }}
-        .hlala-allele {{
-            background-color: #e8f5e9;
-        }}
-        tr:nth-child(even) {{
-            background-color: #f9f9f9;
-        }}
-        tr:hover {{
-            background-color: #f1f1f1;
-        }}
-        .allele {{
-            display: block;
-            margin: 3px 0;
-            padding: 2px 5px;
-            background-color: #e3f2fd;
-            border-radius: 3px;
-            font-family: monospace;
-        }}
-        .estimation-allele {{
-            background-color: #fff3e0;
-        }}
-        .rank-info {{
-            color: #666;
-            font-size: 11px;
-        }}
-        .no-data {{
-            color: #999;
-            font-style: italic;
-        }}
-        .matching {{
-            background-color: #c8e6c9;
-            font-weight: bold;
-        }}
-    </style>
-</head>
-<body>
-    <h1>HLA Typing Results Comparison</h1>
-    <div class="sample-info">Sample: <strong>{sample_name}</strong></div>
-    <div class="table-container">
-        <table>
-            <thead>
-                <tr>
-                    <th class="gene-col">Gene</th>
-                    <th class="method-col">OptiType</th>
-                    <th class="method-col">HLA-LA</th>
-                    <th class="method-col">HLA-HD</th>
-                    <th class="method-col">HISAT-genotype</th>
-                </tr>
-            </thead>
-            <tbody>
-"""
-
-    # Add rows for each gene
-    for gene in all_genes:
-        html += f"                <tr>\n"
-        html += f"                    <td><strong>{gene}</strong></td>\n"
-
-        # OptiType column - sort alphabetically
-        html += "                    <td>"
-        if gene in data['optitype'] and data['optitype'][gene]:
-            for allele in sorted(data['optitype'][gene]):
-                html += f'<span class="allele optitype-allele">{allele}</span>'
-        else:
-            html += '<span class="no-data">No data</span>'
-        html += "</td>\n"
-
-        # HLA-LA column - sort alphabetically
-        html += "                    <td>"
-        if gene in data['hlala'] and data['hlala'][gene]:
-            for allele in sorted(data['hlala'][gene]):
-                html += f'<span class="allele hlala-allele">{allele}</span>'
-        else:
-            html += '<span class="no-data">No data</span>'
-        html += "</td>\n"
-
-        # Estimation column - sort alphabetically
-        html += "                    <td>"
-        if gene in data['estimation'] and data['estimation'][gene]:
-            for allele in sorted(data['estimation'][gene]):
-                html += f'<span class="allele estimation-allele">{allele}</span>'
-        else:
-            html += '<span class="no-data">No data</span>'
-        html += "</td>\n"
-
-        # HISAT-genotype column - sort alphabetically, preserve rank as attribute
-        html += "                    <td>"
-        if gene in data['hisat'] and data['hisat'][gene]:
-            for allele_info in sorted(data['hisat'][gene], key=lambda x: x['allele']):
-                allele = allele_info['allele']
-                abundance = allele_info['abundance']
-                rank = allele_info['rank']
-                html += f'<span class="allele" data-rank="{rank}">{allele} <span class="rank-info">(rank: {rank}, {abundance}%)</span></span>'
-        else:
-            html += '<span class="no-data">No data</span>'
-        html += "</td>\n"
-
-        html += "                </tr>\n"
-
-    html += """            </tbody>
-        </table>
-    </div>
-</body>
-</html>
-"""
-
-    with open(output_file, 'w') as f:
-        f.write(html)
+    all_genes = sorted(set().union(data['hisat'], data['estimation'],
+                                   data['optitype'], data['hlala']))
+
+    # Stream the page straight to disk instead of assembling it in memory
+    with open(output_file, 'w', buffering=1 << 20) as f:
+        f.write(_PAGE_HEAD % (sample_name, STYLESHEET_NAME, sample_name))
+
+        # Render each method's cells once; genes a method has no alleles for
+        # fall back to the shared no-data span
+        # OptiType, HLA-LA and estimation columns - sorted alphabetically
+        opti_cells = {gene: format_alleles(alleles, 'optitype-allele')
+                      for gene, alleles in data['optitype'].items() if alleles}
+        hlala_cells = {gene: format_alleles(alleles, 'hlala-allele')
+                       for gene, alleles in data['hlala'].items() if alleles}
+        est_cells = {gene: format_alleles(alleles, 'estimation-allele')
+                     for gene, alleles in data['estimation'].items() if alleles}
+        # HISAT-genotype column - sorted alphabetically, preserve rank as attribute
+        hisat_cells = {gene: format_hisat_alleles(allele_infos)
+                       for gene, allele_infos in data['hisat'].items() if allele_infos}
+
+        # Add rows for each gene
+        for gene in all_genes:
+            f.write(_ROW_TMPL % (gene,
+                                 opti_cells.get(gene, _NO_DATA),
+                                 hlala_cells.get(gene, _NO_DATA),
+                                 est_cells.get(gene, _NO_DATA),
+                                 hisat_cells.get(gene, _NO_DATA)))
+
+        f.write(PAGE_FOOT)
 
     print(f"Generated: {output_file}")
 
@@ -345,32 +379,44 @@ def main():
     hlala_dir = '/igor-shared/HLA-LA/working'
     output_dir = 'comparison_results'
 
+    # Build each root path once and share it across all samples
+    hisat_root = Path(hisat_dir)
+    estimation_root = Path(estimation_dir)
+    optitype_root = Path(optitype_dir)
+    hlala_root = Path(hlala_dir)
+    output_root = Path(output_dir)
+
     # Create output directory
-    Path(output_dir).mkdir(exist_ok=True)
+    output_root.mkdir(exist_ok=True)
 
     # Get all samples from hisat output
-    hisat_path = Path(hisat_dir)
-    if not hisat_path.exists():
+    if not hisat_root.exists():
         print(f"Error: {hisat_dir} not found")
         return
 
+    # Write the stylesheet shared by every page
+    (output_root / STYLESHEET_NAME).write_text(_STYLESHEET)
+
     samples = []
-    for sample_dir in sorted(hisat_path.iterdir()):
+    for sample_dir in sorted(hisat_root.iterdir()):
         if sample_dir.is_dir():
             samples.append(sample_dir.name)
 
     print(f"Processing {len(samples)} samples...")
 
-    # Process each sample
-    for sample_name in samples:
-        print(f"\nProcessing {sample_name}...")
+    # Collect data for all samples concurrently; map() keeps sample order
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+        sample_data = executor.map(
+            lambda s: collect_sample_data(s, hisat_root, estimation_root, optitype_root, hlala_root),
+            samples)
 
-        # Collect data for this sample
-        data = collect_sample_data(sample_name, hisat_dir, estimation_dir, optitype_dir, hlala_dir)
+        # Process each sample
+        for sample_name, data in zip(samples, sample_data):
+            print(f"\nProcessing {sample_name}...")
 
-        # Generate HTML file
-        output_file = Path(output_dir) / f'{sample_name}_comparison.html'
-        generate_sample_html(data, output_file)
+            # Generate HTML file
+            output_file = output_root / f'{sample_name}_comparison.html'
+            generate_sample_html(data, output_file)
 
     print(f"\n✓ Done! Generated {len(samples)} comparison files in '{output_dir}/' directory")
     print(f"  Open any HTML file to view the comparison")